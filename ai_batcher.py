@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+
+class AIBatcher:
+    """Собирает промпты, пришедшие почти одновременно, в один запрос к HF"""
+
+    def __init__(self, client, max_batch_size: int = 16, max_queue_time: float = 0.02):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self.logger = logging.getLogger(__name__)
+        self._queue: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def process(self, prompt: str) -> Tuple[bool, str]:
+        """Ставит промпт в очередь и ждет ответа из пакетного запроса"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((prompt, future))
+
+        # Если отправлять нечего, уходим сразу; иначе копим пакет,
+        # пока не заполнится или не истечет время ожидания
+        if not self._tasks or len(self._queue) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_queue_time, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Отправляет накопленные промпты одним пакетом"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._queue:
+            return
+
+        batch = self._queue[:self.max_batch_size]
+        del self._queue[:self.max_batch_size]
+
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        """Снимает пакет с учета и сразу отправляет то, что накопилось"""
+        self._tasks.discard(task)
+        if self._queue:
+            self._flush()
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Выполняет пакетный запрос и раздает ответы ожидающим"""
+        try:
+            results = await self.client.batch_generate([prompt for prompt, _ in batch])
+        except Exception as e:
+            self.logger.error("Ошибка пакетного запроса к HF: %s", e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
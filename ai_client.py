@@ -1,13 +1,51 @@
+import asyncio
 import aiohttp
 import logging
-from config import Config
-from typing import Dict, Any
+import random
+import re
+import time
+from collections import Counter, deque
+from config import Config, config
+from json_fast import dumps as _json_dumps, loads as _json_loads
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - зависит от окружения
+    ahocorasick = None
+
+_SYS_PROMPT = "Ты - полезный AI-ассистент для Telegram бота. Веди естественную беседу."
+_ROLE_TAG = {'user': 'Пользователь:', 'assistant': 'Ассистент:'}
+_ASSISTANT_TAG = _ROLE_TAG['assistant']
+_MAX_PROMPT_CHARS = 2000
+_PROBE_BODY = b'{"inputs":"."}'
+_PROBE_TTL = 10
+
+_BAD_WORDS = frozenset(word.lower() for word in config.BAD_WORDS)
+
+_WS_RE = re.compile(r'\s+')
+_MAX_RESPONSE_LENGTH = 1000
+
+_FNV_OFFSET = 0xcbf29ce484222325
+_FNV_PRIME = 0x100000001b3
+_FNV_MASK = (1 << 64) - 1
+
+
+def _fnv1a(data: bytes) -> int:
+    """64-битный FNV-1a: детерминированный между перезапусками хеш"""
+    h = _FNV_OFFSET
+    for byte in data:
+        h = ((h ^ byte) * _FNV_PRIME) & _FNV_MASK
+    return h
 
 
 class HuggingFaceClient:
     """Асинхронный AI-клиент для HuggingFace Inference API"""
 
-    def __init__(self):
+    # Общий для всех клиентов предохранитель: пока он открыт, HF не вызываем
+    _breaker = {'open_until': 0.0}
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
         self.logger = logging.getLogger(__name__)
         self.api_url = Config.HUGGINGFACE_API_URL
         self.token = Config.HUGGINGFACE_TOKEN
@@ -15,92 +53,325 @@ class HuggingFaceClient:
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
+        self.generation_params = {
+            name: value for name, value in (
+                ("max_new_tokens", Config.MAX_NEW_TOKENS),
+                ("temperature", Config.TEMPERATURE)
+            ) if value is not None
+        }
+        # Параметры не меняются, поэтому сериализуем их один раз;
+        # если они не заданы, тело запроса содержит только inputs
+        self._params_suffix = b'}'
+        if self.generation_params:
+            self._params_suffix = (
+                b',"parameters":'
+                + _json_dumps(self.generation_params)
+                + b'}'
+            )
+        # Сессию может передать владелец (например, вебхук-сервер);
+        # тогда заголовки и таймаут задаются на каждый запрос, а закрывает её владелец
+        self._session = session
+        self._owns_session = session is None
+        self._timeout = aiohttp.ClientTimeout(total=Config.REQUEST_TIMEOUT)
+        self._last_ok_at = 0.0
+        self._last_result = False
+        self.cache: Dict[int, Tuple[float, str]] = {}
+        self._cache_ttl = 300
+        self._cache_max = 100
+        self._inflight: Dict[int, asyncio.Future] = {}
+        # Необязательный AIBatcher, объединяющий промпты в пакетные запросы
+        self.batcher = None
+        self._sem = asyncio.Semaphore(Config.HF_MAX_INFLIGHT or 8)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую сессию, создавая её при первом обращении"""
+        if self._owns_session and (self._session is None or self._session.closed):
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=Config.HF_MAX_INFLIGHT or 8,
+                    keepalive_timeout=75,
+                    ttl_dns_cache=300
+                )
+            )
+        return self._session
+
+    async def aclose(self) -> None:
+        """Закрывает HTTP-сессию клиента, если она создана им самим"""
+        if not self._owns_session:
+            return
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def test_connection(self) -> bool:
-        """Проверка API"""
+        """Проверка API (успешный результат кэшируется на несколько секунд)"""
+        now = time.monotonic()
+        if self._last_result and now - self._last_ok_at < _PROBE_TTL:
+            return True
+
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    json={"inputs": "Hello"},
-                    headers=self.headers,
-                    timeout=10
-                ) as r:
-                    return r.status in (200, 503)
+            session = await self._get_session()
+            async with session.post(
+                self.api_url,
+                data=_PROBE_BODY,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as r:
+                self._last_result = r.status in (200, 503)
+                if self._last_result:
+                    self._last_ok_at = now
+                return self._last_result
 
         except Exception as e:
-            self.logger.error(f"Ошибка HF соединения: {e}")
+            self.logger.error("Ошибка HF соединения: %s", e)
+            self._last_result = False
             return False
 
     async def generate_response(self, user_message: str, conversation_history: list) -> str:
         """Генерация ответа модели"""
 
         prompt = self._build_prompt(conversation_history, user_message)
-        payload = {"inputs": prompt}
+        return await self.generate_response_for_prompt(prompt)
+
+    def _cache_get(self, key: int) -> Optional[str]:
+        """Возвращает ответ из кэша, если запись не устарела"""
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+
+        # Изредка забываем запись, чтобы неудачный ответ не жил весь TTL
+        if entry[0] <= time.monotonic() or random.random() < 0.01:
+            self.cache.pop(key, None)
+            return None
+
+        return entry[1]
+
+    def _cache_put(self, key: int, text: str) -> None:
+        """Кладет ответ в кэш, вытесняя самую старую запись при переполнении"""
+        if key not in self.cache and len(self.cache) >= self._cache_max:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = (time.monotonic() + self._cache_ttl, text)
+
+    async def generate_response_for_prompt(self, prompt: str) -> str:
+        """Генерация ответа по готовому промпту"""
+        cache_key = self._cache_key(prompt)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Одинаковые промпты, пришедшие одновременно, ждут один запрос к HF
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(prompt, cache_key))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+
+        return await asyncio.shield(task)
+
+    async def _fetch(self, prompt: str, cache_key: int) -> str:
+        """Запрашивает ответ у HF и кладет успешный результат в кэш"""
+        if self.batcher is not None:
+            ok, text = await self.batcher.process(prompt)
+        else:
+            ok, text = await self._request(prompt)
+        if ok:
+            self._cache_put(cache_key, text)
+        return text
+
+    async def generate_many(self, prompts: List[str]) -> List[str]:
+        """Параллельная генерация ответов для нескольких промптов"""
+        return await asyncio.gather(
+            *(self.generate_response_for_prompt(p) for p in prompts)
+        )
+
+    async def batch_generate(self, prompts: List[str]) -> List[Tuple[bool, str]]:
+        """Генерирует ответы для нескольких промптов одним запросом к HF"""
+        # Одиночный промпт уходит обычным запросом со строкой в inputs
+        if len(prompts) == 1:
+            return [await self._request(prompts[0])]
+
+        ok, data = await self._post(_json_dumps(prompts))
+        if not ok:
+            return [(False, data)] * len(prompts)
+
+        if not isinstance(data, list) or len(data) != len(prompts):
+            return [(False, "⚠️ Пустой ответ от модели.")] * len(prompts)
+
+        return [self._parse_output(item) for item in data]
+
+    async def _request(self, prompt: str) -> Tuple[bool, str]:
+        """Отправляет промпт в HF, возвращает (успех, текст или сообщение об ошибке)"""
+        ok, data = await self._post(_json_dumps(prompt))
+        if not ok:
+            return False, data
+
+        return self._parse_output(data)
+
+    async def _post(self, inputs_json: bytes) -> Tuple[bool, Any]:
+        """POST в HF с повторами; возвращает (успех, JSON ответа или сообщение об ошибке)"""
+        body = b'{"inputs":' + inputs_json + self._params_suffix
+
+        breaker = type(self)._breaker
+        if time.monotonic() < breaker['open_until']:
+            return False, config.MESSAGES['api_timeout']
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30
-                ) as r:
-                    data = await r.json()
+            session = await self._get_session()
+            attempts = max(1, Config.MAX_RETRIES)
+            for attempt in range(attempts):
+                async with self._sem:
+                    async with session.post(
+                        self.api_url,
+                        data=body,
+                        headers=self.headers,
+                        timeout=self._timeout
+                    ) as r:
+                        status = r.status
+                        # Модель загружается или превышен лимит запросов: тело
+                        # не разбираем, шлюз может прислать вместо JSON страницу
+                        if status not in (429, 503):
+                            data = _json_loads(await r.read())
+                            break
 
-                    # Ошибка HF
-                    if isinstance(data, dict) and "error" in data:
-                        return "⚠️ Ошибка модели: " + data["error"]
+                if attempt == attempts - 1:
+                    self.logger.warning("HF недоступен (HTTP %s), пауза запросов на 30 с", status)
+                    breaker['open_until'] = time.monotonic() + 30
+                    return False, config.MESSAGES['api_timeout']
 
-                    # HF Router output
-                    if isinstance(data, dict) and "generated_text" in data:
-                        return data["generated_text"]
+                await asyncio.sleep(min(30, random.uniform(1, 2 ** attempt)))
 
-                    # Classical HF list output
-                    if isinstance(data, list) and "generated_text" in data[0]:
-                        return data[0]["generated_text"]
+            # Ошибка HF
+            if isinstance(data, dict) and "error" in data:
+                return False, "⚠️ Ошибка модели: " + data["error"]
 
-                    return "⚠️ Пустой ответ от модели."
+            return True, data
 
         except Exception as e:
-            self.logger.error(f"HF API error: {e}")
-            return "⚠️ Ошибка подключения к ИИ."
+            self.logger.error("HF API error: %s", e)
+            return False, "⚠️ Ошибка подключения к ИИ."
 
-    def _build_prompt(self, history: list, user_message: str) -> str:
-        prompt = ""
+    def _parse_output(self, data: Any) -> Tuple[bool, str]:
+        """Преобразует выход модели для одного промпта в (успех, текст)"""
+        text = self._extract_generated_text(data)
+        if text:
+            return True, text
+
+        return False, "⚠️ Пустой ответ от модели."
+
+    @staticmethod
+    def _extract_generated_text(data: Any) -> Optional[str]:
+        """Достает ответ модели из JSON HF, отрезая повторенный промпт"""
+        # HF Router output
+        if isinstance(data, dict):
+            text = data.get("generated_text")
+
+        # Classical HF list output
+        elif isinstance(data, list) and data and isinstance(data[0], dict):
+            text = data[0].get("generated_text")
+
+        else:
+            return None
+
+        if not text:
+            return None
 
-        for msg in history:
-            prompt += f"{msg['role'].title()}: {msg['content']}\n"
+        _, sep, tail = text.rpartition(_ASSISTANT_TAG)
+        if sep:
+            text = tail
+        return HuggingFaceClient._clean_response(text) or None
 
-        prompt += f"User: {user_message}\nAI:"
-        return prompt
+    @staticmethod
+    def _clean_response(text: str) -> str:
+        """Нормализует пробелы и обрезает слишком длинный ответ"""
+        text = _WS_RE.sub(' ', text).strip()
+        if len(text) > _MAX_RESPONSE_LENGTH:
+            text = text[:_MAX_RESPONSE_LENGTH] + '...'
+        return text
+
+    @staticmethod
+    def _cache_key(prompt: str) -> int:
+        """Ключ кэша: промпт уже однозначно описывает запрос к модели"""
+        return _fnv1a(prompt.encode('utf-8'))
+
+    @staticmethod
+    def _prompt_window(history: list) -> deque:
+        """Последние реплики диалога, укладывающиеся в бюджет символов промпта"""
+        window = deque()
+        budget = _MAX_PROMPT_CHARS
+        for msg in reversed(history):
+            budget -= len(msg['content'])
+            if budget < 0:
+                break
+            window.appendleft(msg)
+        return window
+
+    def _build_prompt(self, history: list, user_message: Optional[str] = None) -> str:
+        """Собирает промпт из последних реплик диалога"""
+        parts = [_SYS_PROMPT]
+        parts.extend(
+            f"{_ROLE_TAG[msg['role']]} {msg['content']}"
+            for msg in self._prompt_window(history) if msg['role'] in _ROLE_TAG
+        )
+        if user_message:
+            parts.append(f"{_ROLE_TAG['user']} {user_message}")
+        parts.append(_ASSISTANT_TAG)
+        return "\n".join(parts)
 
 class AIService:
     """Улучшенный сервис для работы с AI"""
     
-    def __init__(self):
-        self.client = HuggingFaceClient()
+    def __init__(self, client: Optional[HuggingFaceClient] = None):
+        self.client = client or HuggingFaceClient()
         self.logger = logging.getLogger(__name__)
         self.request_count = 0
         self.error_count = 0
+        self._stats_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._bad_automaton = self._build_bad_automaton(_BAD_WORDS)
+        self._bad_re = None
+        if self._bad_automaton is None and _BAD_WORDS:
+            # Без pyahocorasick используем одно скомпилированное выражение
+            self._bad_re = re.compile(
+                '|'.join(sorted(map(re.escape, _BAD_WORDS), key=len, reverse=True)),
+                re.IGNORECASE
+            )
+    
+    @staticmethod
+    def _build_bad_automaton(words):
+        """Собирает автомат Ахо-Корасик по списку запрещенных слов"""
+        if ahocorasick is None or not words:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for word in words:
+            automaton.add_word(word, word)
+        automaton.make_automaton()
+        return automaton
     
     def contains_inappropriate_content(self, text: str) -> bool:
         """Проверяет текст на наличие нежелательного контента"""
         if not text:
             return False
         
-        text_lower = text.lower()
+        text_lower = text if text.islower() else text.lower()
         
         # Проверка запрещенных слов
-        inappropriate_words = any(bad_word in text_lower for bad_word in config.BAD_WORDS)
+        if self._bad_automaton is not None:
+            inappropriate_words = next(self._bad_automaton.iter(text_lower), None) is not None
+        else:
+            inappropriate_words = self._bad_re is not None and self._bad_re.search(text) is not None
         
         # Дополнительные проверки
-        too_many_caps = sum(1 for c in text if c.isupper()) > len(text) * 0.7  # 70% заглавных
-        too_many_repeats = any(text_lower.count(word) > 5 for word in text_lower.split()[:10])
+        too_many_caps = sum(map(str.isupper, text)) > len(text) * 0.7  # 70% заглавных
+        tokens = text_lower.split()
+        too_many_repeats = False
+        if len(tokens) > 5:
+            counts = Counter(tokens)
+            too_many_repeats = any(counts[word] > 5 for word in tokens[:10])
         
         return inappropriate_words or too_many_caps or too_many_repeats
     
-    def process_message(self, user_id: int, message: str, context_manager: 'ContextManager') -> str:
+    async def process_message(self, user_id: int, message: str, context_manager: 'ContextManager') -> str:
         """
         Обрабатывает сообщение пользователя и генерирует ответ
         
@@ -117,18 +388,18 @@ class AIService:
         try:
             # Проверяем на нежелательный контент
             if self.contains_inappropriate_content(message):
-                self.logger.warning(f"Обнаружен нежелательный контент от пользователя {user_id}")
+                self.logger.warning("Обнаружен нежелательный контент от пользователя %s", user_id)
                 self.error_count += 1
                 return config.MESSAGES['content_warning']
             
+            # Получаем историю диалога до текущего сообщения
+            conversation_history = context_manager.get_conversation_history(user_id)
+            
             # Добавляем сообщение пользователя в контекст
             context_manager.add_user_message(user_id, message)
             
-            # Получаем историю диалога
-            conversation_history = context_manager.get_conversation_history(user_id)
-            
             # Генерируем ответ
-            ai_response = self.client.generate_response(conversation_history)
+            ai_response = await self.client.generate_response(message, conversation_history)
             
             if ai_response:
                 # Добавляем ответ бота в контекст
@@ -139,15 +410,21 @@ class AIService:
                 return config.MESSAGES['error']
                 
         except Exception as e:
-            self.logger.error(f"Ошибка при обработке сообщения: {e}")
+            self.logger.error("Ошибка при обработке сообщения: %s", e)
             self.error_count += 1
             return config.MESSAGES['error']
     
     def get_stats(self) -> Dict[str, Any]:
-        """Возвращает статистику сервиса"""
-        return {
+        """Возвращает статистику сервиса (пересчитывается не чаще раза в секунду)"""
+        now = time.monotonic()
+        if self._stats_cache is not None and now - self._stats_cache[0] < 1.0:
+            return dict(self._stats_cache[1])
+        
+        stats = {
             'total_requests': self.request_count,
             'error_count': self.error_count,
             'success_rate': ((self.request_count - self.error_count) / self.request_count * 100) 
                             if self.request_count > 0 else 100
-        }
\ No newline at end of file
+        }
+        self._stats_cache = (now, stats)
+        return dict(stats)
\ No newline at end of file
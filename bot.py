@@ -1,5 +1,10 @@
+import asyncio
+import functools
 import logging
-from telegram import Update
+import time
+from typing import Optional
+import aiohttp
+from telegram import Message, Update
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -8,67 +13,190 @@ from telegram.ext import (
     filters
 )
 
-from config import Config
+from config import Config, config
 from ai_client import HuggingFaceClient
+from ai_batcher import AIBatcher
 from context_manager import ContextManager
 from filters import content_filter
-from logging_config import setup_logging
+from logging_config import setup_logging, stop_logging
+from rate_limiter import DelayQueue
+
+
+@functools.lru_cache(maxsize=1)
+def _format_uptime(whole_seconds: int) -> str:
+    """Форматирует аптайм; значение кэшируется в пределах одной секунды"""
+    hours, remainder = divmod(whole_seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}ч {minutes}м {seconds}с"
 
 
 class CodeQueenBot:
     """Telegram бот с AI-интеграцией"""
 
-    def __init__(self):
+    def __init__(self, http_session: Optional[aiohttp.ClientSession] = None):
         setup_logging()
         self.logger = logging.getLogger("bot")
 
-        self.ai = HuggingFaceClient()
-        self.context_manager = ContextManager()
+        self.ai = HuggingFaceClient(session=http_session)
+        self._batcher: Optional[AIBatcher] = None
+        if Config.HF_BATCHING:
+            self._batcher = AIBatcher(self.ai, max_batch_size=16, max_queue_time=0.02)
+            self.ai.batcher = self._batcher
+        self.context_manager = ContextManager(
+            max_context_length=Config.MAX_CONTEXT_LENGTH,
+            session_timeout=Config.SESSION_TIMEOUT
+        )
+        self._send_q = DelayQueue(burst_limit=28, time_limit_ms=1000)
+        self.start_time = time.monotonic()
+        self._status_prefix = "📊 Статус бота\n\n"
+        self._health: Optional[asyncio.Task] = None
+        self._health_at = 0.0
+
+        # Тексты ответов не меняются во время работы: берем их один раз,
+        # заодно опечатка в ключе проявится при старте, а не в обработчике
+        self._msg_api_timeout = config.MESSAGES['api_timeout']
+
+        # Аргументы статических ответов на команды собираем один раз
+        self._start_kwargs = dict(
+            text="Привет! Я CodeQueen 🤖\nЗадай мне любой вопрос!",
+            disable_web_page_preview=True
+        )
+        self._help_kwargs = dict(
+            text="/start – приветствие\n"
+                 "/about – о боте\n"
+                 "/reset – сброс диалога\n"
+                 "/status – статус бота\n"
+                 "/help – помощь",
+            disable_web_page_preview=True
+        )
+        self._about_kwargs = dict(
+            text="CodeQueen Bot — Telegram бот с AI.\n"
+                 "Работаю на HuggingFace Inference API.",
+            disable_web_page_preview=True
+        )
 
         self.application = (
             Application.builder()
             .token(Config.TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(True)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
             .build()
         )
 
         self._register_handlers()
+        self._schedule_jobs()
+
+    def _schedule_jobs(self):
+        """Регистрирует периодические задачи бота"""
+        job_queue = self.application.job_queue
+        if job_queue is None:
+            self.logger.warning("JobQueue недоступна: истекшие контексты не будут очищаться")
+            return
+
+        job_queue.run_repeating(
+            self._gc_contexts,
+            interval=self.context_manager.session_timeout / 4,
+            first=60
+        )
+
+    async def _gc_contexts(self, context: ContextTypes.DEFAULT_TYPE):
+        """Удаляет истекшие контексты диалогов"""
+        self.context_manager.cleanup_expired_contexts()
+
+    async def _post_init(self, application: Application):
+        """Хук PTB после initialize()"""
+        await self.startup()
+
+    async def startup(self):
+        """Проверки при запуске, когда event loop уже работает"""
+        # Python 3.12+: короткие обработчики выполняются без лишнего шага планировщика
+        if hasattr(asyncio, "eager_task_factory"):
+            asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+        self._warm_up()
+
+        # Проверка HF и запрос информации о боте идут параллельно; проба HF
+        # заодно разрешает DNS и открывает keep-alive соединение к модели
+        async with asyncio.TaskGroup() as tg:
+            hf_task = tg.create_task(self._cached_health())
+            me_task = tg.create_task(self.application.bot.get_me())
+
+        if hf_task.result():
+            self.logger.info("✅ Hugging Face API работает корректно")
+        else:
+            self.logger.warning("⚠️ Проблемы с подключением к HF API")
+
+        self.logger.info("🤖 Бот @%s готов к работе", me_task.result().username)
+
+    def _warm_up(self):
+        """Прогоняет горячий путь на пробном тексте, чтобы не платить за это на первом апдейте"""
+        sample = "прогрев"
+        content_filter.filter_message(sample)
+        self.ai._build_prompt([], sample)
+
+    async def _post_shutdown(self, application: Application):
+        """Хук PTB после shutdown()"""
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Освобождает ресурсы после остановки приложения"""
+        await self.ai.aclose()
+        stop_logging()
+
+    async def _reply(self, message: Message, text: str, **kwargs) -> Message:
+        """Отвечает на сообщение, не превышая лимит Telegram на исходящие сообщения"""
+        await self._send_q.acquire()
+        return await message.reply_text(text, **kwargs)
 
     def _register_handlers(self):
         self.application.add_handler(CommandHandler("start", self.cmd_start))
         self.application.add_handler(CommandHandler("help", self.cmd_help))
         self.application.add_handler(CommandHandler("about", self.cmd_about))
         self.application.add_handler(CommandHandler("reset", self.cmd_reset))
+        self.application.add_handler(CommandHandler("status", self.cmd_status))
 
         self.application.add_handler(
             MessageHandler(
-                filters.TEXT & ~filters.COMMAND,
+                filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND,
                 self.handle_message
             )
         )
 
     async def cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(
-            "Привет! Я CodeQueen 🤖\nЗадай мне любой вопрос!"
-        )
+        await self._reply(update.message, **self._start_kwargs)
 
     async def cmd_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(
-            "/start – приветствие\n"
-            "/about – о боте\n"
-            "/reset – сброс диалога\n"
-            "/help – помощь"
-        )
+        await self._reply(update.message, **self._help_kwargs)
 
     async def cmd_about(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(
-            "CodeQueen Bot — Telegram бот с AI.\n"
-            "Работаю на HuggingFace Inference API."
-        )
+        await self._reply(update.message, **self._about_kwargs)
 
     async def cmd_reset(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         uid = update.message.from_user.id
-        self.context_manager.reset_context(uid)
-        await update.message.reply_text("Контекст очищен 🔄")
+        # Ждем ответа на сообщение в обработке, иначе он запишется в очищенную историю
+        async with self.context_manager.lock_for(uid):
+            self.context_manager.clear_user_context(uid)
+        await self._reply(update.message, "Контекст очищен 🔄")
+
+    async def _cached_health(self) -> bool:
+        """Проверка HF, общая для всех запросов в течение 15 секунд"""
+        now = time.monotonic()
+        if self._health is None or now - self._health_at >= 15:
+            self._health = asyncio.ensure_future(self.ai.test_connection())
+            self._health_at = now
+        return await asyncio.shield(self._health)
+
+    async def cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        ai_ok = await self._cached_health()
+        stats = self.context_manager.get_stats()
+        uptime = _format_uptime(int(time.monotonic() - self.start_time))
+        await self._reply(update.message, "".join([
+            self._status_prefix,
+            "AI: ", "✅ доступен" if ai_ok else "⚠️ недоступен", "\n",
+            "Активных диалогов: ", str(stats['active_contexts']), "\n",
+            "Время работы: ", uptime
+        ]))
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_text = update.message.text
@@ -77,21 +205,32 @@ class CodeQueenBot:
         # Фильтрация мата
         is_clean, msg = content_filter.filter_message(user_text)
         if not is_clean:
-            await update.message.reply_text(msg)
+            await self._reply(update.message, msg)
             return
 
-        # История
-        history = self.context_manager.get_context(user_id)
-
-        # AI ответ
-        ai_reply = await self.ai.generate_response(
-            user_message=user_text,
-            conversation_history=history
-        )
-
-        # Сохраняем
-        self.context_manager.append_to_context(
-            user_id, user_text, ai_reply
-        )
-
-        await update.message.reply_text(ai_reply)
\ No newline at end of file
+        # Сообщения одного пользователя обрабатываем по очереди,
+        # чтобы реплики в истории не перемешивались
+        async with self.context_manager.lock_for(user_id):
+            # История
+            history = self.context_manager.get_conversation_history(user_id)
+
+            # AI ответ: клиент сам ограничивает число запросов к HF,
+            # здесь лишь не даем одному ответу висеть бесконечно
+            try:
+                ai_reply = await asyncio.wait_for(
+                    self.ai.generate_response(
+                        user_message=user_text,
+                        conversation_history=history
+                    ),
+                    timeout=Config.AI_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self.logger.warning("Таймаут ответа AI для пользователя %s", user_id)
+                await self._reply(update.message, self._msg_api_timeout)
+                return
+
+            # Сохраняем
+            self.context_manager.add_user_message(user_id, user_text)
+            self.context_manager.add_bot_message(user_id, ai_reply)
+
+            await self._reply(update.message, ai_reply)
@@ -26,6 +26,13 @@ class Config:
     # Настройки AI
     MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
     REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "30"))
+    HF_MAX_INFLIGHT = int(os.getenv("HF_MAX_INFLIGHT", "8"))
+    AI_TIMEOUT = int(os.getenv("AI_TIMEOUT", "60"))
+    # Пакетные запросы (массив inputs) поддерживает не каждый эндпоинт HF
+    HF_BATCHING = os.getenv("HF_BATCHING", "false").lower() == "true"
+    # Параметры генерации необязательны: без них модель работает с настройками по умолчанию
+    MAX_NEW_TOKENS = int(os.getenv("MAX_NEW_TOKENS")) if os.getenv("MAX_NEW_TOKENS") else None
+    TEMPERATURE = float(os.getenv("TEMPERATURE")) if os.getenv("TEMPERATURE") else None
     
     # Фильтрация контента
     BAD_WORDS = [
@@ -1,49 +1,71 @@
 import time
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, List, Dict, Any, Optional
 from datetime import datetime, timedelta
 
+
+@dataclass(slots=True, frozen=True)
+class ChatMsg:
+    """Компактная запись одного сообщения в истории диалога"""
+    role: str
+    content: str
+    ts: float  # time.monotonic() в момент добавления
+
+
 class DialogContext:
     """Класс для управления контекстом диалога одного пользователя"""
     
+    __slots__ = (
+        'max_length', 'messages', 'user_data', 'user_id', 'timeout',
+        'created_at', '_created_at_mono', '_updated_at_mono'
+    )
+    
     def __init__(self, user_id: int, max_length: int = 10, timeout: int = 3600):
-        self.user_id = user_id
         self.max_length = max_length
+        self.messages: Deque[ChatMsg] = deque(maxlen=max_length)
+        self.user_data: Dict[str, Any] = {}
+        self.reset(user_id, timeout)
+    
+    def reset(self, user_id: int, timeout: int) -> None:
+        """Готовит контекст к новой сессии, переиспользуя его контейнеры"""
+        self.user_id = user_id
         self.timeout = timeout
+        self.messages.clear()
+        self.user_data.clear()
         self.created_at = datetime.now()
-        self.updated_at = datetime.now()
-        self.messages: List[Dict[str, str]] = []
-        self.user_data: Dict[str, Any] = {}
+        # Дальше время отмечаем только монотонными часами: на каждое
+        # сообщение один вызов time.monotonic() без построения datetime
+        self._created_at_mono = time.monotonic()
+        self._updated_at_mono = self._created_at_mono
+    
+    @property
+    def updated_at(self) -> datetime:
+        """Время последней активности (вычисляется по монотонным часам)"""
+        return self.created_at + timedelta(seconds=self._updated_at_mono - self._created_at_mono)
         
     def add_message(self, role: str, content: str) -> None:
         """Добавляет сообщение в историю диалога"""
-        self.updated_at = datetime.now()
+        now = time.monotonic()
+        self._updated_at_mono = now
         
-        message = {
-            'role': role,
-            'content': content,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        self.messages.append(message)
-        
-        # Ограничиваем длину истории
-        if len(self.messages) > self.max_length:
-            self.messages = self.messages[-self.max_length:]
+        # deque с maxlen сам вытесняет самые старые сообщения
+        self.messages.append(ChatMsg(role, content, now))
     
     def get_conversation_history(self) -> List[Dict[str, str]]:
         """Возвращает историю диалога"""
-        return self.messages.copy()
+        return [{'role': msg.role, 'content': msg.content} for msg in self.messages]
     
     def clear_history(self) -> None:
         """Очищает историю диалога"""
         self.messages.clear()
-        self.updated_at = datetime.now()
+        self._updated_at_mono = time.monotonic()
     
     def is_expired(self) -> bool:
         """Проверяет, истекла ли сессия"""
-        expiry_time = self.updated_at + timedelta(seconds=self.timeout)
-        return datetime.now() > expiry_time
+        return time.monotonic() - self._updated_at_mono > self.timeout
     
     def get_user_info(self) -> Dict[str, Any]:
         """Возвращает информацию о пользователе"""
@@ -62,30 +84,50 @@ class ContextManager:
     def __init__(self, max_context_length: int = 10, session_timeout: int = 3600):
         self.max_context_length = max_context_length
         self.session_timeout = session_timeout
-        self.contexts: Dict[int, DialogContext] = {}
+        # Контексты упорядочены по последней активности: самые старые в начале
+        self.contexts: "OrderedDict[int, DialogContext]" = OrderedDict()
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        # Освободившиеся контексты переиспользуются для новых сессий
+        self._pool: List[DialogContext] = []
+        self._pool_limit = 512
         self.logger = logging.getLogger(__name__)
     
     def get_context(self, user_id: int) -> DialogContext:
         """Получает или создает контекст для пользователя"""
-        if user_id not in self.contexts or self.contexts[user_id].is_expired():
-            self.contexts[user_id] = DialogContext(
-                user_id=user_id,
-                max_length=self.max_context_length,
-                timeout=self.session_timeout
-            )
-            self.logger.info(f"Создан новый контекст для пользователя {user_id}")
+        context = self.contexts.get(user_id)
+        if context is None or context.is_expired():
+            if context is not None:
+                context.reset(user_id, self.session_timeout)
+            elif self._pool:
+                context = self._pool.pop()
+                context.reset(user_id, self.session_timeout)
+            else:
+                context = DialogContext(
+                    user_id=user_id,
+                    max_length=self.max_context_length,
+                    timeout=self.session_timeout
+                )
+            self.contexts[user_id] = context
+            self.contexts.move_to_end(user_id)
+            self.logger.info("Создан новый контекст для пользователя %s", user_id)
         
-        return self.contexts[user_id]
+        return context
+    
+    def lock_for(self, user_id: int) -> asyncio.Lock:
+        """Возвращает блокировку, упорядочивающую обработку сообщений пользователя"""
+        return self._user_locks.setdefault(user_id, asyncio.Lock())
     
     def add_user_message(self, user_id: int, message: str) -> None:
         """Добавляет сообщение пользователя в контекст"""
         context = self.get_context(user_id)
         context.add_message('user', message)
+        self.contexts.move_to_end(user_id)
     
     def add_bot_message(self, user_id: int, message: str) -> None:
         """Добавляет сообщение бота в контекст"""
         context = self.get_context(user_id)
         context.add_message('assistant', message)
+        self.contexts.move_to_end(user_id)
     
     def get_conversation_history(self, user_id: int) -> List[Dict[str, str]]:
         """Получает историю диалога пользователя"""
@@ -96,33 +138,50 @@ class ContextManager:
         """Очищает контекст пользователя"""
         if user_id in self.contexts:
             self.contexts[user_id].clear_history()
-            self.logger.info(f"Контекст пользователя {user_id} очищен")
+            self.contexts.move_to_end(user_id)
+            self.logger.info("Контекст пользователя %s очищен", user_id)
             return True
         return False
     
     def cleanup_expired_contexts(self) -> int:
         """Очищает истекшие контексты и возвращает количество удаленных"""
-        expired_users = [
-            user_id for user_id, context in self.contexts.items() 
-            if context.is_expired()
-        ]
+        expired_users = []
+        for user_id, context in self.contexts.items():
+            # Дальше идут только более свежие контексты
+            if not context.is_expired():
+                break
+            expired_users.append(user_id)
         
         for user_id in expired_users:
-            del self.contexts[user_id]
+            context = self.contexts.pop(user_id)
+            if len(self._pool) < self._pool_limit:
+                context.messages.clear()
+                context.user_data.clear()
+                self._pool.append(context)
+            
+            lock = self._user_locks.get(user_id)
+            if lock is not None and not lock.locked():
+                del self._user_locks[user_id]
         
         if expired_users:
-            self.logger.info(f"Очищено {len(expired_users)} истекших контекстов")
+            self.logger.info("Очищено %s истекших контекстов", len(expired_users))
         
         return len(expired_users)
     
     def get_stats(self) -> Dict[str, Any]:
         """Возвращает статистику менеджера контекстов"""
-        active_contexts = sum(1 for ctx in self.contexts.values() if not ctx.is_expired())
+        # Истекшие контексты лежат в начале, а регулярная очистка
+        # не дает им накапливаться, поэтому обход обычно короткий
+        expired_contexts = 0
+        for ctx in self.contexts.values():
+            if not ctx.is_expired():
+                break
+            expired_contexts += 1
         
         return {
             'total_contexts': len(self.contexts),
-            'active_contexts': active_contexts,
-            'expired_contexts': len(self.contexts) - active_contexts,
+            'active_contexts': len(self.contexts) - expired_contexts,
+            'expired_contexts': expired_contexts,
             'max_context_length': self.max_context_length,
             'session_timeout': self.session_timeout
         }
\ No newline at end of file
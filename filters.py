@@ -1,39 +1,72 @@
 import re
 import logging
-from typing import List, Set
+from typing import FrozenSet, List, Optional, Pattern
 from config import config
 
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - зависит от окружения
+    ahocorasick = None
+
+# С какого размера словаря автомат Ахо-Корасик выгоднее регулярного выражения
+_AC_MIN_WORDS = 32
+
+# 11 одинаковых символов подряд: фиксированный повтор вместо жадного {10,}
+_RUN_RE = re.compile(r'(.)\1{10}')
+
+# Максимальная длина пользовательского сообщения
+_MAX_TEXT_LEN = 1000
+
 class ContentFilter:
     """Класс для фильтрации нежелательного контента"""
     
     def __init__(self):
-        self.bad_words = set(config.BAD_WORDS)
+        # Неизменяемый набор в нижнем регистре: автомат ищет по text.lower()
+        self.bad_words: FrozenSet[str] = frozenset(word.lower() for word in config.BAD_WORDS)
         self.logger = logging.getLogger(__name__)
+        self._rebuild_matcher()
         
-        # Регулярные выражения для более сложных проверок
-        self.patterns = [
-            re.compile(r'\b(?:[a-z]*[x]{2,}[a-z]*)\b', re.IGNORECASE),  # Маскированный мат (xx)
-            re.compile(r'\b(?:[a-z]*[0-9]{2,}[a-z]*)\b', re.IGNORECASE),  # Замена букв цифрами
-        ]
+        # Маскированный мат (xx) и замена букв цифрами одним выражением
+        self._masked_re = re.compile(
+            r'\b(?:[a-z]*[x]{2,}[a-z]*|[a-z]*[0-9]{2,}[a-z]*)\b', re.IGNORECASE
+        )
+    
+    def _rebuild_matcher(self) -> None:
+        """Пересобирает структуру для поиска запрещенных слов"""
+        self._automaton = None
+        self._bad_re = None
+        
+        # Для большого словаря время поиска автоматом не зависит от числа слов
+        if ahocorasick is not None and len(self.bad_words) >= _AC_MIN_WORDS:
+            self._automaton = ahocorasick.Automaton()
+            for word in self.bad_words:
+                self._automaton.add_word(word, word)
+            self._automaton.make_automaton()
+        else:
+            self._bad_re = self._compile_bad_words(self.bad_words)
+    
+    @staticmethod
+    def _compile_bad_words(words: FrozenSet[str]) -> Optional[Pattern[str]]:
+        """Собирает запрещенные слова в одно регулярное выражение"""
+        if not words:
+            return None
+        
+        alternation = "|".join(map(re.escape, sorted(words, key=len, reverse=True)))
+        return re.compile(alternation, re.IGNORECASE)
     
     def contains_bad_words(self, text: str) -> bool:
         """Проверяет текст на наличие запрещенных слов"""
         if not text:
             return False
         
-        text_lower = text.lower()
-        
-        # Простая проверка по словам
-        for bad_word in self.bad_words:
-            if bad_word in text_lower:
+        # Один проход по тексту вместо проверки каждого слова
+        if self._automaton is not None:
+            if next(self._automaton.iter(text.lower()), None) is not None:
                 return True
+        elif self._bad_re is not None and self._bad_re.search(text):
+            return True
         
-        # Проверка по регулярным выражениям
-        for pattern in self.patterns:
-            if pattern.search(text):
-                return True
-        
-        return False
+        return self._masked_re.search(text) is not None
     
     def filter_message(self, text: str) -> tuple[bool, str]:
         """
@@ -43,15 +76,16 @@ class ContentFilter:
             (is_clean, filtered_text_or_warning)
         """
         if self.contains_bad_words(text):
-            self.logger.warning(f"Обнаружен нежелательный контент: {text}")
+            self.logger.warning("Обнаружен нежелательный контент: %s", text)
             return False, config.MESSAGES['content_warning']
         
         return True, text
     
     def add_custom_words(self, words: List[str]) -> None:
         """Добавляет пользовательские слова в фильтр"""
-        self.bad_words.update(word.lower() for word in words)
-        self.logger.info(f"Добавлено {len(words)} пользовательских слов в фильтр")
+        self.bad_words = self.bad_words.union(word.lower() for word in words)
+        self._rebuild_matcher()
+        self.logger.info("Добавлено %s пользовательских слов в фильтр", len(words))
 
 
 class InputValidator:
@@ -66,11 +100,11 @@ class InputValidator:
         if len(text.strip()) < 1:
             return False, "Слишком короткое сообщение"
         
-        if len(text) > 1000:
+        if len(text) > _MAX_TEXT_LEN:
             return False, "Сообщение слишком длинное"
         
         # Проверка на повторяющиеся символы (спам)
-        if re.search(r'(.)\1{10,}', text):  # 10+ одинаковых символов подряд
+        if _RUN_RE.search(text):  # 10+ одинаковых символов подряд
             return False, "Сообщение содержит слишком много повторяющихся символов"
         
         return True, "OK"
@@ -78,15 +112,13 @@ class InputValidator:
     @staticmethod
     def sanitize_text(text: str) -> str:
         """Очищает текст от потенциально опасных символов"""
-        # Убираем крайние пробелы
-        text = text.strip()
-        
-        # Заменяем множественные пробелы на один
-        text = re.sub(r'\s+', ' ', text)
+        # split() без аргументов за один проход убирает крайние пробелы
+        # и схлопывает любые последовательности пробельных символов
+        text = " ".join(text.split())
         
         # Обрезаем до разумной длины
-        if len(text) > 1000:
-            text = text[:1000] + "..."
+        if len(text) > _MAX_TEXT_LEN:
+            text = text[:_MAX_TEXT_LEN] + "..."
         
         return text
 
@@ -0,0 +1,26 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - зависит от окружения
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        """Сериализует объект в JSON (UTF-8 байты)"""
+        return orjson.dumps(obj)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        """Разбирает JSON из байтов или строки"""
+        return orjson.loads(data)
+
+else:  # pragma: no cover - зависит от окружения
+    def dumps(obj: Any) -> bytes:
+        """Сериализует объект в JSON (UTF-8 байты)"""
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    def loads(data: Union[bytes, str]) -> Any:
+        """Разбирает JSON из байтов или строки"""
+        return json.loads(data)
@@ -1,6 +1,14 @@
 import logging
+import logging.handlers
+import queue
 import sys
 from pathlib import Path
+from typing import Optional
+
+# Фоновый поток, который пишет логи в файл и консоль
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
 
 def setup_logging(log_level: str = "INFO", log_file: str = "bot.log") -> None:
     """Настраивает логирование для приложения"""
@@ -15,8 +23,10 @@ def setup_logging(log_level: str = "INFO", log_file: str = "bot.log") -> None:
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
-    # Хендлер для файла
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    # Хендлер для файла (с ротацией, чтобы лог не рос бесконечно)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8'
+    )
     file_handler.setFormatter(formatter)
     file_handler.setLevel(log_level)
     
@@ -30,12 +40,20 @@ def setup_logging(log_level: str = "INFO", log_file: str = "bot.log") -> None:
     root_logger.setLevel(log_level)
     
     # Очищаем существующие хендлеры
+    stop_logging()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
     
-    # Добавляем наши хендлеры
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    # QueueHandler.prepare() подставляет аргументы в сообщение в вызывающем
+    # потоке; итоговое форматирование и запись выполняются в фоновом потоке
+    global _listener, _queue_handler
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root_logger.addHandler(_queue_handler)
     
     # Устанавливаем уровень логирования для внешних библиотек
     logging.getLogger('httpx').setLevel(logging.WARNING)
@@ -45,32 +63,53 @@ def setup_logging(log_level: str = "INFO", log_file: str = "bot.log") -> None:
     logging.info("Логирование настроено успешно")
 
 
+def stop_logging() -> None:
+    """Останавливает фоновую запись логов, дописав накопленные записи"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    
+    _listener.stop()
+    
+    # Дальше пишем напрямую, иначе записи копились бы в очереди без читателя
+    root_logger = logging.getLogger()
+    root_logger.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        root_logger.addHandler(handler)
+    
+    _listener = None
+    _queue_handler = None
+
+
 class BotLogger:
     """Упрощенный логгер для бота"""
     
     def __init__(self, name: str):
         self.logger = logging.getLogger(name)
     
-    def info(self, message: str, user_id: int = None) -> None:
-        """Логирует информационное сообщение"""
+    @staticmethod
+    def _with_user(message: str, args: tuple, user_id: Optional[int]) -> tuple:
+        """Добавляет к сообщению префикс пользователя, не форматируя строку"""
         if user_id:
-            message = f"[User {user_id}] {message}"
-        self.logger.info(message)
+            return "[User %s] " + message, (user_id,) + args
+        return message, args
+    
+    def info(self, message: str, *args, user_id: int = None) -> None:
+        """Логирует информационное сообщение"""
+        message, args = self._with_user(message, args, user_id)
+        self.logger.info(message, *args)
     
-    def warning(self, message: str, user_id: int = None) -> None:
+    def warning(self, message: str, *args, user_id: int = None) -> None:
         """Логирует предупреждение"""
-        if user_id:
-            message = f"[User {user_id}] {message}"
-        self.logger.warning(message)
+        message, args = self._with_user(message, args, user_id)
+        self.logger.warning(message, *args)
     
-    def error(self, message: str, user_id: int = None, exc_info: bool = False) -> None:
+    def error(self, message: str, *args, user_id: int = None, exc_info: bool = False) -> None:
         """Логирует ошибку"""
-        if user_id:
-            message = f"[User {user_id}] {message}"
-        self.logger.error(message, exc_info=exc_info)
+        message, args = self._with_user(message, args, user_id)
+        self.logger.error(message, *args, exc_info=exc_info)
     
-    def debug(self, message: str, user_id: int = None) -> None:
+    def debug(self, message: str, *args, user_id: int = None) -> None:
         """Логирует отладочное сообщение"""
-        if user_id:
-            message = f"[User {user_id}] {message}"
-        self.logger.debug(message)
\ No newline at end of file
+        message, args = self._with_user(message, args, user_id)
+        self.logger.debug(message, *args)
\ No newline at end of file
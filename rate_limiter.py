@@ -0,0 +1,24 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque
+
+
+class DelayQueue:
+    """Ограничитель исходящих сообщений: не больше burst_limit за time_limit_ms"""
+
+    def __init__(self, burst_limit: int = 28, time_limit_ms: int = 1000):
+        self.burst_limit = burst_limit
+        self.time_limit = time_limit_ms / 1000
+        # Кольцо моментов последних отправок
+        self._sent: Deque[float] = deque(maxlen=burst_limit)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Ждет, пока отправка очередного сообщения не превысит лимит"""
+        async with self._lock:
+            if len(self._sent) == self.burst_limit:
+                wait = self._sent[0] + self.time_limit - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            self._sent.append(time.monotonic())
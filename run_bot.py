@@ -1,33 +1,33 @@
 #!/usr/bin/env python3
 import asyncio
+from telegram import Update
 from bot import CodeQueenBot
-from ai_client import HuggingFaceClient
 
-
-async def start_bot():
-    bot = CodeQueenBot()
-    client = HuggingFaceClient()
-
-    # Проверяем соединение с HuggingFace
-    if await client.test_connection():
-        bot.logger.info("✅ Hugging Face API работает корректно")
-    else:
-        bot.logger.warning("⚠️ Проблемы с подключением к HF API")
-
-    # Информация о боте
-    me = await bot.application.bot.get_me()
-    bot.logger.info(f"🤖 Бот @{me.username} готов к работе")
-
-    # ВАЖНО: run_polling НАЧИНАЕТ event loop САМА
-    await bot.application.initialize()
-    await bot.application.start()
-    await bot.application.run_polling()   # ← больше НИЧЕГО не вызываем вокруг неё
-    await bot.application.stop()
+try:
+    import uvloop
+except ImportError:  # нет на Windows: остается стандартный event loop
+    uvloop = None
+else:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 
 def main():
     print("🤖 Запуск CodeQueen Bot...")
-    asyncio.run(start_bot())   # ← единственный event loop
+    bot = CodeQueenBot()
+
+    # run_polling сам создает event loop, инициализирует, запускает
+    # и останавливает приложение; проверки при старте — в post_init бота.
+    # Бот отвечает только на новые сообщения: остальные обновления
+    # (правки, реакции, посты каналов) Telegram даже не присылает.
+    # Длинный long-poll: пока обновлений нет, getUpdates висит на сервере
+    # до 50 с вместо частых коротких запросов
+    bot.application.run_polling(
+        timeout=50,
+        poll_interval=0.0,
+        bootstrap_retries=-1,
+        drop_pending_updates=True,
+        allowed_updates=[Update.MESSAGE],
+    )
 
 
 if __name__ == "__main__":
@@ -1,10 +1,33 @@
 import unittest
 import asyncio
-from unittest.mock import Mock, AsyncMock, patch
+import json
+import time
+from typing import Optional
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
 from config import config
 from context_manager import ContextManager, DialogContext
 from ai_client import AIService, HuggingFaceClient
+from ai_batcher import AIBatcher
+from bot import CodeQueenBot
+import filters
 from filters import ContentFilter, InputValidator
+from rate_limiter import DelayQueue
+
+
+# Длинный текст для проверки обрезки
+_LONG_TEXT = "а" * 1500
+
+# Один event loop на все асинхронные тесты модуля
+_runner: Optional[asyncio.Runner] = None
+
+
+def setUpModule():
+    global _runner
+    _runner = asyncio.Runner()
+
+
+def tearDownModule():
+    _runner.close()
 
 
 class TestContextManager(unittest.TestCase):
@@ -47,6 +70,43 @@ class TestContextManager(unittest.TestCase):
         
         history = self.context_manager.get_conversation_history(self.user_id)
         self.assertEqual(len(history), 0)
+    
+    def test_stats_and_cleanup(self):
+        """Тест статистики и очистки истекших контекстов"""
+        self.context_manager.add_user_message(self.user_id, "Первый")
+        self.context_manager.add_user_message(self.user_id + 1, "Второй")
+        self.context_manager.get_context(self.user_id).timeout = -1
+        
+        stats = self.context_manager.get_stats()
+        self.assertEqual(stats['total_contexts'], 2)
+        self.assertEqual(stats['active_contexts'], 1)
+        self.assertEqual(stats['expired_contexts'], 1)
+        
+        self.assertEqual(self.context_manager.cleanup_expired_contexts(), 1)
+        self.assertNotIn(self.user_id, self.context_manager.contexts)
+    
+    def test_context_pool_reuse(self):
+        """Тест переиспользования освобожденных контекстов"""
+        self.context_manager.add_user_message(self.user_id, "Старое сообщение")
+        old_context = self.context_manager.get_context(self.user_id)
+        old_context.timeout = -1
+        self.context_manager.cleanup_expired_contexts()
+        
+        context = self.context_manager.get_context(self.user_id + 1)
+        self.assertIs(context, old_context)
+        self.assertEqual(context.user_id, self.user_id + 1)
+        self.assertEqual(context.timeout, 3600)
+        self.assertEqual(context.get_conversation_history(), [])
+    
+    def test_user_locks(self):
+        """Тест блокировок пользователей и их очистки"""
+        lock = self.context_manager.lock_for(self.user_id)
+        self.assertIs(lock, self.context_manager.lock_for(self.user_id))
+        self.assertIsNot(lock, self.context_manager.lock_for(self.user_id + 1))
+        
+        self.context_manager.get_context(self.user_id).timeout = -1
+        self.context_manager.cleanup_expired_contexts()
+        self.assertIsNot(lock, self.context_manager.lock_for(self.user_id))
 
 
 class TestContentFilter(unittest.TestCase):
@@ -61,6 +121,19 @@ class TestContentFilter(unittest.TestCase):
         self.assertTrue(self.filter.contains_bad_words("ненавижу тебя"))
         self.assertFalse(self.filter.contains_bad_words("привет как дела"))
     
+    def test_custom_words_large_dictionary(self):
+        """Тест поиска по большому пользовательскому словарю"""
+        self.filter.add_custom_words([f"запрет{i}слово" for i in range(40)])
+        self.assertTrue(self.filter.contains_bad_words("тут ЗАПРЕТ7СЛОВО есть"))
+        self.assertTrue(self.filter.contains_bad_words("ты глупый бот"))
+        self.assertFalse(self.filter.contains_bad_words("привет как дела"))
+    
+    @unittest.skipUnless(filters.ahocorasick, "pyahocorasick не установлен")
+    def test_large_dictionary_uses_automaton(self):
+        """Тест перехода на автомат Ахо-Корасик для большого словаря"""
+        self.filter.add_custom_words([f"запрет{i}слово" for i in range(40)])
+        self.assertIsNotNone(self.filter._automaton)
+    
     def test_filter_message(self):
         """Тест фильтрации сообщений"""
         is_clean, result = self.filter.filter_message("нормальное сообщение")
@@ -96,8 +169,7 @@ class TestInputValidator(unittest.TestCase):
         self.assertEqual(sanitized, "много пробелов")
         
         # Тест обрезки длинного текста
-        long_text = "а" * 1500
-        sanitized = InputValidator.sanitize_text(long_text)
+        sanitized = InputValidator.sanitize_text(_LONG_TEXT)
         self.assertTrue(len(sanitized) <= 1003)  # 1000 + "..."
 
 class TestAIService(unittest.TestCase):
@@ -119,23 +191,23 @@ class TestAIService(unittest.TestCase):
         # Мокаем ответ AI
         mock_generate.return_value = "Это тестовый ответ от AI"
         
-        response = self.ai_service.process_message(
+        response = _runner.run(self.ai_service.process_message(
             self.user_id, 
             "Тестовое сообщение", 
             self.context_manager
-        )
+        ))
         
         self.assertEqual(response, "Это тестовый ответ от AI")
-        mock_generate.assert_called_once()
+        mock_generate.assert_awaited_once()
     
     @patch('ai_client.HuggingFaceClient.generate_response')
     def test_process_message_with_bad_content(self, mock_generate):
         """Тест обработки сообщения с нежелательным контентом"""
-        response = self.ai_service.process_message(
+        response = _runner.run(self.ai_service.process_message(
             self.user_id,
             "глупый идиот",
             self.context_manager
-        )
+        ))
         
         self.assertEqual(response, config.MESSAGES['content_warning'])
         mock_generate.assert_not_called()  # AI не должен вызываться
@@ -161,6 +233,89 @@ class TestHuggingFaceClient(unittest.TestCase):
         self.assertIn("Пользователь: Хорошо, а у тебя?", prompt)
         self.assertIn("Ассистент:", prompt)
     
+    def test_generation_params_opt_in(self):
+        """Тест: параметры генерации попадают в запрос, только если заданы"""
+        with patch.multiple('ai_client.Config', MAX_NEW_TOKENS=None, TEMPERATURE=None):
+            self.assertEqual(HuggingFaceClient()._params_suffix, b'}')
+        
+        with patch.multiple('ai_client.Config', MAX_NEW_TOKENS=50, TEMPERATURE=None):
+            suffix = HuggingFaceClient()._params_suffix
+        self.assertEqual(json.loads(b'{"inputs":"."' + suffix)['parameters'], {'max_new_tokens': 50})
+    
+    def test_build_prompt_budget(self):
+        """Тест ограничения промпта бюджетом символов"""
+        history = [{'role': 'user', 'content': str(i) * 600} for i in range(5)]
+        
+        prompt = self.client._build_prompt(history)
+        self.assertNotIn("1" * 600, prompt)
+        self.assertIn("2" * 600, prompt)
+        self.assertIn("4" * 600, prompt)
+    
+    def test_cache_key(self):
+        """Тест детерминированного ключа кэша"""
+        history = [{'role': 'user', 'content': 'Привет'}]
+        prompt = self.client._build_prompt(history, 'Как дела?')
+        key = self.client._cache_key(prompt)
+        self.assertEqual(key, self.client._cache_key(self.client._build_prompt(list(history), 'Как дела?')))
+        self.assertNotEqual(key, self.client._cache_key(self.client._build_prompt(history, 'Как дела')))
+        self.assertNotEqual(key, self.client._cache_key(self.client._build_prompt([], 'Как дела?')))
+    
+    @patch('ai_client.random.random', return_value=1.0)
+    def test_response_cache(self, _mock_random):
+        """Тест кэша ответов с TTL"""
+        self.client._cache_put(1, 'Ответ')
+        self.assertEqual(self.client._cache_get(1), 'Ответ')
+        
+        self.client._cache_ttl = -1
+        self.client._cache_put(2, 'Устаревший ответ')
+        self.assertIsNone(self.client._cache_get(2))
+        self.assertNotIn(2, self.client.cache)
+    
+    def test_open_breaker_skips_request(self):
+        """Тест предохранителя: при открытом состоянии HF не вызывается"""
+        with patch.dict(HuggingFaceClient._breaker, {'open_until': float('inf')}):
+            ok, text = _runner.run(self.client._request("Привет"))
+        self.assertFalse(ok)
+        self.assertEqual(text, config.MESSAGES['api_timeout'])
+        self.assertIsNone(self.client._session)
+    
+    @patch('ai_client.asyncio.sleep', new_callable=AsyncMock)
+    def test_retry_then_open_breaker(self, _mock_sleep):
+        """Тест повторов при 503 и открытия предохранителя после последней попытки"""
+        response = MagicMock(status=503)
+        response.read = AsyncMock(return_value=b'<html>Service Unavailable</html>')
+        session = MagicMock()
+        session.post.return_value.__aenter__ = AsyncMock(return_value=response)
+        session.post.return_value.__aexit__ = AsyncMock(return_value=False)
+        
+        with patch.dict(HuggingFaceClient._breaker, {'open_until': 0.0}), \
+                patch.object(self.client, '_get_session', AsyncMock(return_value=session)):
+            ok, text = _runner.run(self.client._request("Привет"))
+            open_until = HuggingFaceClient._breaker['open_until']
+        
+        self.assertFalse(ok)
+        self.assertEqual(text, config.MESSAGES['api_timeout'])
+        self.assertEqual(session.post.call_count, max(1, config.MAX_RETRIES))
+        self.assertGreater(open_until, time.monotonic())
+    
+    def test_concurrent_identical_prompts(self):
+        """Тест объединения одновременных одинаковых запросов"""
+        async def slow_request(prompt):
+            await asyncio.sleep(0.01)
+            return True, "Ответ"
+        
+        async def run():
+            return await asyncio.gather(
+                *(self.client.generate_response_for_prompt("Промпт") for _ in range(5))
+            )
+        
+        with patch.object(self.client, '_request', side_effect=slow_request) as mock_request:
+            results = _runner.run(run())
+        
+        self.assertEqual(results, ["Ответ"] * 5)
+        mock_request.assert_called_once()
+        self.assertEqual(self.client._inflight, {})
+    
     def test_extract_generated_text(self):
         """Тест извлечения сгенерированного текста"""
         # Тест с правильным форматом ответа
@@ -171,6 +326,101 @@ class TestHuggingFaceClient(unittest.TestCase):
         # Тест с пустым ответом
         text = self.client._extract_generated_text([])
         self.assertIsNone(text)
+    
+    def test_batch_generate_request_body(self):
+        """Тест формата inputs: строка для одного промпта, массив для пакета"""
+        async def fake_post(inputs_json):
+            inputs = json.loads(inputs_json)
+            if isinstance(inputs, list):
+                return True, [[{'generated_text': 'Ответ'}] for _ in inputs]
+            return True, [{'generated_text': 'Ответ'}]
+        
+        with patch.object(self.client, '_post', side_effect=fake_post) as mock_post:
+            single = _runner.run(self.client.batch_generate(["Один"]))
+            pair = _runner.run(self.client.batch_generate(["Один", "Два"]))
+        
+        self.assertEqual(json.loads(mock_post.await_args_list[0].args[0]), "Один")
+        self.assertEqual(json.loads(mock_post.await_args_list[1].args[0]), ["Один", "Два"])
+        self.assertEqual(single, [(True, 'Ответ')])
+        self.assertEqual(pair, [(True, 'Ответ')] * 2)
+
+
+class TestCodeQueenBot(unittest.TestCase):
+    """Тесты для обработчиков бота"""
+    
+    def setUp(self):
+        # Обходим __init__: приложению Telegram нужен настоящий токен
+        self.bot = CodeQueenBot.__new__(CodeQueenBot)
+        self.bot.logger = Mock()
+        self.bot.context_manager = ContextManager()
+        self.bot.ai = Mock()
+        self.bot._reply = AsyncMock()
+        self.bot._msg_api_timeout = config.MESSAGES['api_timeout']
+        self.user_id = 12345
+    
+    def _update(self, text):
+        update = Mock()
+        update.message.text = text
+        update.message.from_user.id = self.user_id
+        return update
+    
+    def test_reset_waits_for_message_in_flight(self):
+        """Тест: /reset во время генерации ответа не оставляет старые реплики"""
+        async def run():
+            started = asyncio.Event()
+            release = asyncio.Event()
+            
+            async def slow_generate(**kwargs):
+                started.set()
+                await release.wait()
+                return "Ответ"
+            
+            self.bot.ai.generate_response = slow_generate
+            message = asyncio.ensure_future(self.bot.handle_message(self._update("Привет"), None))
+            await started.wait()
+            reset = asyncio.ensure_future(self.bot.cmd_reset(self._update("/reset"), None))
+            await asyncio.sleep(0)
+            release.set()
+            await asyncio.gather(message, reset)
+        
+        _runner.run(run())
+        self.assertEqual(self.bot.context_manager.get_conversation_history(self.user_id), [])
+
+
+class TestAIBatcher(unittest.TestCase):
+    """Тесты для пакетной отправки промптов"""
+    
+    def test_prompts_are_batched(self):
+        """Тест объединения одновременных промптов в пакеты"""
+        client = Mock()
+        client.batch_generate = AsyncMock(
+            side_effect=lambda prompts: [(True, p.upper()) for p in prompts]
+        )
+        batcher = AIBatcher(client, max_batch_size=4)
+        
+        async def run():
+            return await asyncio.gather(*(batcher.process(f"p{i}") for i in range(6)))
+        
+        results = _runner.run(run())
+        
+        self.assertEqual(results, [(True, f"P{i}") for i in range(6)])
+        self.assertLess(client.batch_generate.await_count, 6)
+
+
+class TestDelayQueue(unittest.TestCase):
+    """Тесты для ограничителя исходящих сообщений"""
+    
+    def test_burst_limit(self):
+        """Тест ожидания при превышении лимита"""
+        async def run():
+            queue = DelayQueue(burst_limit=2, time_limit_ms=50)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            for _ in range(3):
+                await queue.acquire()
+            return loop.time() - start
+        
+        self.assertGreaterEqual(_runner.run(run()), 0.04)
 
 
 if __name__ == "__main__":
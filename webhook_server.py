@@ -1,62 +1,104 @@
 import os
+import asyncio
 import logging
+import aiohttp
 from aiohttp import web
+from telegram import Update
 from bot import CodeQueenBot
+from config import Config
+from json_fast import loads as _json_loads
+
+try:
+    import uvloop
+except ImportError:  # нет на Windows: остается стандартный event loop
+    uvloop = None
+else:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+# Тело ответа /health не меняется: создаем его один раз
+_OK_BODY = b'OK'
+
 
 async def create_app():
     """Создает aiohttp приложение для вебхука"""
     app = web.Application()
     
+    # Один пул соединений на все время жизни сервера
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=75)
+    )
+    app['session'] = session
+    
     # Инициализируем бота
-    bot = CodeQueenBot()
+    bot = CodeQueenBot(http_session=session)
     app['bot'] = bot
     
     # Добавляем роуты
     app.router.add_post('/webhook', handle_webhook)
     app.router.add_get('/health', health_check)
     
+    # Приложение PTB живет столько же, сколько сервер: его диспетчер
+    # разбирает update_queue, в которую складывает вебхук
+    app.on_startup.append(start_application)
+    app.on_cleanup.append(stop_application)
+    app.on_cleanup.append(close_session)
+    
     return app
 
 
+async def start_application(app):
+    """Запускает приложение бота вместе с сервером"""
+    bot = app['bot']
+    # on_startup отрабатывает до открытия порта: инициализация и прогрев
+    # в startup() не попадают в окно ответа на первый вебхук
+    await bot.application.initialize()
+    await bot.startup()
+    await bot.application.start()
+
+
+async def stop_application(app):
+    """Останавливает приложение бота вместе с сервером"""
+    bot = app['bot']
+    await bot.application.stop()
+    await bot.application.shutdown()
+    await bot.shutdown()
+
+
+async def close_session(app):
+    """Закрывает общую HTTP-сессию после остановки бота"""
+    await app['session'].close()
+
+
 async def handle_webhook(request):
     """Обработчик вебхука от Telegram"""
     bot = request.app['bot']
     
     try:
         # Получаем обновление от Telegram
-        data = await request.json()
+        data = _json_loads(await request.read())
         update = Update.de_json(data, bot.application.bot)
         
-        # Обрабатываем обновление
-        await bot.application.process_update(update)
+        # Отдаем обновление диспетчеру и сразу отвечаем Telegram:
+        # время генерации ответа не держит HTTP-запрос вебхука
+        bot.application.update_queue.put_nowait(update)
         
-        return web.Response(status=200, text='OK')
+        # Telegram смотрит только на статус: тело ответа не нужно
+        return web.Response(status=200)
     
-    except Exception as e:
-        logging.error(f"Ошибка обработки вебхука: {e}")
+    except (ValueError, KeyError) as e:
+        # Битое тело запроса; ошибки в коде пусть падают громко
+        logging.error("Ошибка обработки вебхука: %s", e)
         return web.Response(status=500, text='Internal Server Error')
 
 
 async def health_check(request):
     """Проверка здоровья приложения"""
-    return web.Response(status=200, text='OK')
+    return web.Response(status=200, body=_OK_BODY, content_type='text/plain')
 
 
 if __name__ == "__main__":
-    # Для запуска через python webhook_server.py
-    import asyncio
-    
-    async def main():
-        app = await create_app()
-        runner = web.AppRunner(app)
-        await runner.setup()
-        
-        site = web.TCPSite(runner, '0.0.0.0', 8443)
-        await site.start()
-        
-        print("Вебхук сервер запущен на порту 8443")
-        
-        # Бесконечный цикл
-        await asyncio.Event().wait()
-    
-    asyncio.run(main())
\ No newline at end of file
+    # Для запуска через python webhook_server.py.
+    # run_app сам ведет event loop и корректно завершает работу по сигналу;
+    # журнал доступа отключен: он форматирует и пишет строку на каждый запрос
+    print(f"Вебхук сервер запущен на порту {Config.PORT}")
+    web.run_app(create_app(), host='0.0.0.0', port=Config.PORT, access_log=None)